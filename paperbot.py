@@ -1,10 +1,32 @@
-import json
+import os
 import random
+import sys
 import time
-from typing import Dict
-import feedparser
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional
+import orjson
+import requests
 from atproto import Client, client_utils
 
+DC_CREATOR = "{http://purl.org/dc/elements/1.1/}creator"
+
+
+def write_json(path: str, data: Dict):
+    """Write data to path via a temp file so a killed run never truncates it"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(data))
+    os.replace(tmp_path, path)
+
+
+def short_authors(creators: str) -> str:
+    """Last names of the first three authors, plus 'et al' if there are more"""
+    # skip blanks so a missing dc:creator or a trailing ", " gives ""
+    names = [name for name in creators.split(", ") if name.strip()]
+    return ", ".join(name.rsplit(None, 1)[-1] for name in names[:3]) + (
+        " et al" if len(names) > 3 else ""
+    )
+
 
 class ArxivBot:
     def __init__(self, handle: str, password: str):
@@ -18,72 +40,108 @@ class ArxivBot:
         post_builder = client_utils.TextBuilder().link("link", link).text(post_text)
         self.client.send_post(post_builder)
 
-    def get_arxiv_feed(self, subject: str = "econ.em+stat.me") -> Dict:
-        """Fetch and parse arxiv RSS feed"""
-        feed = feedparser.parse(f"https://rss.arxiv.org/rss/{subject}")
-        return {
-            entry.link.strip(): {
-                "title": entry.title.strip(),
-                "link": entry.link.strip(),
-                "description": (
-                    entry.description.split("Abstract:", 1)[1].strip()
-                    if "Abstract:" in entry.description
-                    else entry.description.strip()
-                ),
-                "authors": ", ".join(
-                    [name.split()[-1] for name in entry.author.split(", ")][:3]
-                )
-                + (" et al" if len(entry.author.split(", ")) > 3 else ""),
+    def get_arxiv_feed(
+        self, subject: str = "econ.em+stat.me", validators: Optional[Dict] = None
+    ) -> Dict:
+        """Fetch and parse arxiv RSS feed
+
+        Pass the same `validators` dict on every call to make the request
+        conditional: an unchanged feed then comes back empty. After a
+        successful fetch the dict holds the response's ETag/Last-Modified.
+        """
+        headers = {}
+        if validators is not None:
+            if "etag" in validators:
+                headers["If-None-Match"] = validators["etag"]
+            if "modified" in validators:
+                headers["If-Modified-Since"] = validators["modified"]
+
+        # like feedparser, treat an unreachable or broken feed as empty so
+        # run() still falls back to posting an archived paper
+        try:
+            response = requests.get(
+                f"https://rss.arxiv.org/rss/{subject}", headers=headers, timeout=30
+            )
+            if response.status_code == 304:
+                return {}
+            response.raise_for_status()
+            root = ET.fromstring(response.content)
+        except (requests.RequestException, ET.ParseError) as e:
+            print(f"Could not fetch arxiv feed: {e!r}", file=sys.stderr)
+            return {}
+
+        if validators is not None:
+            validators.clear()
+            for key, header in (("etag", "ETag"), ("modified", "Last-Modified")):
+                if header in response.headers:
+                    validators[key] = response.headers[header]
+
+        papers = {}
+        for entry in root.iter("item"):
+            link = entry.findtext("link", "").strip()
+            desc = entry.findtext("description", "")
+            creators = entry.findtext(DC_CREATOR, "")
+            before, sep, after = desc.partition("Abstract:")
+            papers[link] = {
+                "title": entry.findtext("title", "").strip(),
+                "link": link,
+                "description": (after if sep else before).strip(),
+                "authors": short_authors(creators),
             }
-            for entry in feed.entries
-        }
+        return papers
 
     def update_archive(self, feed: Dict, archive_file: str = "combined.json") -> tuple:
-        """Update archive with new entries"""
+        """Update archive in place with new entries, return (new keys, archive)"""
         try:
-            with open(archive_file, "r") as f:
-                archive = json.load(f)
+            with open(archive_file, "rb") as f:
+                archive = orjson.loads(f.read())
         except FileNotFoundError:
             archive = {}
 
-        new_archive = archive.copy()
-        for k, v in feed.items():
-            if k not in archive:
-                new_archive[k] = v
-
-        if len(new_archive) > len(archive):
-            with open(archive_file, "w") as f:
-                json.dump(new_archive, f)
+        new_keys = [k for k in feed if k not in archive]
+        if new_keys:
+            archive.update((k, feed[k]) for k in new_keys)
+            write_json(archive_file, archive)
 
-        return feed, archive
+        return new_keys, archive
 
-    def run(self):
+    def run(self, cache_file: str = "feed_cache.json"):
         """Main bot loop"""
-        feed, archive = self.update_archive(self.get_arxiv_feed())
-        new_posts = 0
-
-        # Post new papers
-        for k, v in feed.items():
-            if k not in archive:
-                self.create_post(v["title"], v["link"], v["description"], v["authors"])
+        # ETag/Last-Modified of the last fetch; a missing or broken cache
+        # just means an unconditional GET
+        try:
+            with open(cache_file, "rb") as f:
+                validators = orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            validators = {}
+        last_validators = dict(validators)
+
+        feed = self.get_arxiv_feed(validators=validators)
+        new_keys, archive = self.update_archive(feed)
+        # only save the new validators once the papers are archived, otherwise
+        # a failed run would get a 304 next time and never see them again
+        if validators != last_validators:
+            write_json(cache_file, validators)
+
+        # Post new papers, spaced out; no need to wait after the last one
+        for i, k in enumerate(new_keys):
+            if i:
                 time.sleep(random.randint(60, 300))
-                new_posts += 1
+            v = feed[k]
+            self.create_post(v["title"], v["link"], v["description"], v["authors"])
 
         # Post random paper if no new ones found
-        if new_posts == 0 and len(archive) > 2:
-            paper = random.choice(list(archive.values()))
+        if not new_keys and len(archive) > 2:
+            paper = archive[random.choice(tuple(archive))]
             # if paper contains key authors - back-compat
             if "authors" in paper:
                 auth = paper["authors"]
             else:
                 auth = ""
             self.create_post(paper["title"], paper["link"], paper["description"], auth)
-            time.sleep(random.randint(30, 60))
 
 
 def main():
-    import os
-
     bot = ArxivBot(os.environ["BSKYBOT"], os.environ["BSKYPWD"])
     bot.run()
 